@@ -0,0 +1,38 @@
+from typing import Iterator, Optional
+import hashlib
+import os
+
+class BloomFilter:
+    """Fixed-size Bloom filter over string keys, persisted as raw bits"""
+
+    def __init__(self, size_bytes: int = 65536, num_hashes: int = 7, path: Optional[str] = None):
+        self.num_bits = size_bytes * 8
+        self.num_hashes = num_hashes
+        self.path = path
+        self.bits = bytearray(size_bytes)
+
+        if path and os.path.exists(path) and os.path.getsize(path) == size_bytes:
+            with open(path, 'rb') as f:
+                self.bits = bytearray(f.read())
+
+    def _positions(self, key: str) -> Iterator[int]:
+        """Derive bit positions with double hashing over one blake2b digest"""
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def add(self, key: str) -> None:
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def save(self) -> None:
+        """Write the bit array to disk so restarts keep the seen set"""
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, 'wb') as f:
+            f.write(self.bits)
@@ -1,65 +1,140 @@
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Callable, Awaitable, Tuple
 from datetime import datetime
+from collections import OrderedDict, deque
+import numpy as np
 import asyncio
+import hashlib
 import logging
-import sys
-import os
-
-sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+import operator
+import re
 
+from .bloom import BloomFilter
 from .entities import ContextEntity, ContextType
 
+# Single pass over the title instead of one substring scan per keyword
+_IMPORTANT_KEYWORDS_RE = re.compile(r"review|important|urgent|executive|client", re.IGNORECASE)
+
+# Events tagged as celebrations at ingest, so readers filter on metadata
+_CELEBRATION_RE = re.compile(r"birthday|anniversary", re.IGNORECASE)
+
+def _calendar_entity_id(event: Dict) -> str:
+    return f"calendar_{event['id']}"
+
+# Fields read by the meeting scorer, fetched in one C-level call when every
+# event in a batch carries them (the Google Calendar server always does)
+_MEETING_FIELDS = ('attendees', 'summary', 'hangoutLink')
+_get_meeting_fields = operator.itemgetter(*_MEETING_FIELDS)
+
+def _probe_meeting_fields(event: Dict) -> tuple:
+    return event.get('attendees', []), event.get('summary', ''), event.get('hangoutLink')
+
 class ContextEngine:
-    def __init__(self, vector_db, llm_client=None):
+    def __init__(self, vector_db, llm_client=None, seen_path: str = "./data/seen.bf"):
         self.vector_db = vector_db
         self.llm_client = llm_client
         self.active_contexts: Dict[str, ContextEntity] = {}
-        self.context_history: List[ContextEntity] = []
+        self.context_history: deque = deque(maxlen=1000)
         self.logger = logging.getLogger(__name__)
         
+        # Search results keyed on (query hash, limit, fields, context version); any
+        # update_context call bumps the version so stale entries never match
+        self._query_cache: OrderedDict = OrderedDict()
+        self._query_cache_size = 512
+        self._ctx_version: int = 0
+        
+        # Entity ids already written to the vector store; polled sources keep
+        # returning the same events, so most ingests can skip the write
+        self._seen_ids = BloomFilter(path=seen_path)
+        
+        self._extractors: Dict[str, Callable[[Any], Awaitable[List[ContextEntity]]]] = {
+            "calendar": self._extract_calendar_entities,
+            "mock": self._extract_mock_entities,  # For testing
+            "demo": lambda data: self._extract_calendar_entities(data.get('events', [])),
+        }
+        # Ids of entities a source update retracts, e.g. cancelled calendar events
+        self._retractors: Dict[str, Callable[[Any], List[str]]] = {
+            "calendar": lambda events: [
+                _calendar_entity_id(event) for event in events if event.get('status') == 'cancelled'
+            ],
+        }
+        
+    @property
+    def version(self) -> int:
+        """Counter bumped every time context is stored or removed"""
+        return self._ctx_version
+    
     async def update_context(self, source: str, data: Dict[str, Any]):
         """Update context from data source"""
         self.logger.info(f"Updating context from {source}")
         
+        retract = self._retractors.get(source)
+        if retract:
+            await self.remove_context(retract(data))
+        
         entities = await self._extract_entities(source, data)
+        self.active_contexts.update({entity.id: entity for entity in entities})
         
-        for entity in entities:
-            await self.vector_db.store_entity(entity)
-            self.active_contexts[entity.id] = entity
-            self.context_history.append(entity)
-            
+        # Bloom misses are definitely new; hits are confirmed against the store
+        # so edited entities with a known id are still rewritten
+        known = [entity for entity in entities if entity.id in self._seen_ids]
+        unchanged = await self.vector_db.unchanged_ids(known) if known else set()
+        changed = [entity for entity in entities if entity.id not in unchanged]
+        
+        if not changed:
+            self.logger.info(f"No new context from {source}")
+            return
+        
+        await self.vector_db.bulk_store_entities(changed)
+        for entity in changed:
+            self._seen_ids.add(entity.id)
+        self._seen_ids.save()
+        self.context_history.extend(changed)
+        
+        for entity in changed:
             # Check for simple alerts
             await self._check_basic_alerts(entity)
+        
+        self._ctx_version += 1
+    
+    async def remove_context(self, entity_ids: List[str]):
+        """Drop entities from the active context and the vector store"""
+        # Bloom misses were never stored, so there is nothing to delete
+        stored = [entity_id for entity_id in entity_ids if entity_id in self._seen_ids]
+        if not stored:
+            return
+        
+        for entity_id in stored:
+            self.active_contexts.pop(entity_id, None)
+        await self.vector_db.delete_entities(stored)
+        self.logger.info(f"Removed {len(stored)} entities from context")
+        self._ctx_version += 1
     
     async def _extract_entities(self, source: str, data: Dict) -> List[ContextEntity]:
         """Extract entities from raw data - simplified version"""
-        entities = []
-        
-        if source == "calendar":
-            entities.extend(await self._extract_calendar_entities(data))
-        elif source == "mock":
-            # For testing
-            entities.extend(await self._extract_mock_entities(data))
-        elif source == "demo":
-            entities.extend(await self._extract_calendar_entities(data.get('events', [])))
-            
-        return entities
+        handler = self._extractors.get(source)
+        return await handler(data) if handler else []
     
     async def _extract_calendar_entities(self, events: List[Dict]) -> List[ContextEntity]:
         """Extract entities from calendar events"""
         entities = []
-        for event in events:
+        # Cancelled events are retracted in update_context, never stored
+        events = [event for event in events if event.get('status') != 'cancelled']
+        importance = self._score_meetings(events)
+        for event, score in zip(events, importance):
+            title = event.get('summary', 'Unknown')
+            is_celebration = _CELEBRATION_RE.search(f"{title} {event.get('description', '')}")
             entity = ContextEntity(
-                id=f"calendar_{event['id']}",
-                type=ContextType.MEETING.value,
+                id=_calendar_entity_id(event),
+                type=ContextType.MEETING,
                 content={
-                    "title": event.get('summary', 'Unknown'),
+                    "title": title,
+                    "category": "celebration" if is_celebration else "event",
                     "start_time": event.get('start', {}).get('dateTime', ''),
                     "end_time": event.get('end', {}).get('dateTime', ''),
                     "source": "calendar"
                 },
                 timestamp=datetime.now(),
-                importance=0.7,
+                importance=float(score),
                 relationships=[]
             )
             entities.append(entity)
@@ -70,7 +145,7 @@ class ContextEngine:
         entities = []
         entity = ContextEntity(
             id="mock_1",
-            type=ContextType.MEETING.value,
+            type=ContextType.MEETING,
             content={
                 "title": "Test Meeting with Acme Corp",
                 "start_time": "2024-01-15T14:00:00Z",
@@ -86,12 +161,27 @@ class ContextEngine:
     
     async def _check_basic_alerts(self, entity: ContextEntity):
         """Check for basic alert conditions"""
-        if entity.type == ContextType.MEETING.value:
+        if entity.type is ContextType.MEETING:
             self.logger.info(f"Meeting alert: {entity.content.get('title')}")
     
-    async def get_relevant_context(self, query: str, limit: int = 5) -> List[Dict]:
-        """Get relevant context for query"""
-        results = await self.vector_db.similarity_search(query, limit)
+    async def get_relevant_context(self, query: str, limit: int = 5,
+                                   fields: Tuple[str, ...] = ("metadatas", "distances"),
+                                   entity_type: Optional[ContextType] = None) -> List[Dict]:
+        """Get relevant context for query; pass "documents" in fields to get the raw text"""
+        type_value = entity_type.value if entity_type is not None else None
+        key = (hashlib.sha256(query.encode()).digest(), limit, fields, type_value, self._ctx_version)
+        cached = self._query_cache.get(key)
+        if cached is not None:
+            self._query_cache.move_to_end(key)
+            return cached
+        
+        results = await self.vector_db.similarity_search(query, limit, fields, type_value)
+        
+        # Empty results may come from a failed search, so only cache hits
+        if results:
+            self._query_cache[key] = results
+            if len(self._query_cache) > self._query_cache_size:
+                self._query_cache.popitem(last=False)
         return results
     
     async def check_meeting_alerts(self) -> List[Dict]:
@@ -99,43 +189,50 @@ class ContextEngine:
         alerts = []
         
         # Get upcoming meetings
-        upcoming = await self.get_relevant_context("meeting", 10)
+        upcoming = await self.get_relevant_context("meeting", 10, fields=("metadatas",),
+                                                   entity_type=ContextType.MEETING)
         
         for item in upcoming:
-            metadata = item.get('metadata', {})
-            if metadata.get('type') == 'meeting':
-                content = metadata.get('content', {})
-                title = content.get('title', 'Unknown meeting')
-                
-                alert = {
-                    "type": "meeting_reminder", 
-                    "title": f"Upcoming: {title}",
-                    "message": "You have this meeting scheduled",
-                    "priority": "medium"
-                }
-                alerts.append(alert)
+            title = item.get('metadata', {}).get('title') or 'Unknown meeting'
+            
+            alert = {
+                "type": "meeting_reminder", 
+                "title": f"Upcoming: {title}",
+                "message": "You have this meeting scheduled",
+                "priority": "medium"
+            }
+            alerts.append(alert)
         
         return alerts
 
     def _calculate_meeting_importance(self, event: Dict) -> float:
         """Calculate importance of a meeting based on various factors"""
-        importance = 0.5  # Base importance
+        return float(self._score_meetings([event])[0])
+    
+    def _score_meetings(self, events: List[Dict]) -> np.ndarray:
+        """Score a batch of meetings in one vectorized pass"""
+        count = len(events)
+        if not count:
+            return np.empty(0)
+        
+        # Specialize field access to the batch schema sniffed from its first event
+        accessor = _get_meeting_fields if events[0].keys() >= set(_MEETING_FIELDS) else _probe_meeting_fields
+        try:
+            fields = list(map(accessor, events))
+        except KeyError:
+            fields = list(map(_probe_meeting_fields, events))
         
         # Factor 1: Number of attendees
-        attendees = event.get('attendees', [])
-        if len(attendees) > 5:
-            importance += 0.2
-        elif len(attendees) > 10:
-            importance += 0.3
+        attendees = np.fromiter((len(f[0]) for f in fields), dtype=np.int32, count=count)
         
         # Factor 2: Keywords in title
-        title = event.get('summary', '').lower()
-        important_keywords = ['review', 'important', 'urgent', 'executive', 'client']
-        if any(keyword in title for keyword in important_keywords):
-            importance += 0.2
+        keywords = np.fromiter(
+            (_IMPORTANT_KEYWORDS_RE.search(f[1]) is not None for f in fields),
+            dtype=np.int8, count=count
+        )
         
         # Factor 3: Video conference
-        if event.get('hangoutLink'):
-            importance += 0.1
+        video = np.fromiter((bool(f[2]) for f in fields), dtype=np.int8, count=count)
         
-        return min(importance, 1.0)
\ No newline at end of file
+        importance = 0.5 + 0.2 * (attendees > 5) + 0.1 * (attendees > 10) + 0.2 * keywords + 0.1 * video
+        return np.minimum(importance, 1.0)
@@ -2,6 +2,7 @@ from dataclasses import dataclass
 from datetime import datetime
 from typing import Dict, Any, List, Optional
 from enum import Enum
+import numpy as np
 
 class ContextType(Enum):
     MEETING = "meeting"
@@ -10,11 +11,12 @@ class ContextType(Enum):
     COMMUNICATION = "communication"
     HEALTH = "health"
 
-@dataclass
+@dataclass(slots=True)
 class ContextEntity:
     id: str
-    type: str
+    type: ContextType
     content: Dict[str, Any]
     timestamp: datetime
     importance: float
-    relationships: List[str]
\ No newline at end of file
+    relationships: List[str]
+    embedding: Optional[np.ndarray] = None
\ No newline at end of file
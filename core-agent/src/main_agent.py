@@ -1,31 +1,165 @@
 import asyncio
 import logging
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import sys
 import os
+import signal
+import threading
+import time
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 # Add the core-agent src to Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from context_engine.engine import ContextEngine
+from context_engine.entities import ContextType
 from memory.vector_store import VectorMemory
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Shared by every meeting alert instead of rebuilding the list per alert
+_MEETING_PREP_ACTIONS = ("Review meeting details", "Prepare any materials")
+
+MENU = (
+    "\nOptions:\n"
+    "1. Run continuous monitoring\n"
+    "2. Interactive context search\n"
+    "3. Check current context\n"
+    "4. Status + search\n"
+    "5. Run monitoring in the background\n"
+    "6. Exit\n"
+)
+
+# A loop turn longer than this means some coroutine ran blocking code
+LOOP_LAG_THRESHOLD = 0.050
+
+async def _watch_loop_lag(current_step: List[str], interval: float = 0.1):
+    """Warn whenever the event loop wakes up late, naming the menu step that was running"""
+    expected = time.perf_counter() + interval
+    while True:
+        await asyncio.sleep(interval)
+        now = time.perf_counter()
+        lag = now - expected
+        if lag > LOOP_LAG_THRESHOLD:
+            logger.warning(f"Event loop blocked for {lag * 1000:.1f}ms during {current_step[0]}")
+        expected = now + interval
+
+def _cancel_all_tasks():
+    """Signal handler: cancel every task on the running loop"""
+    for task in asyncio.all_tasks():
+        task.cancel()
+
+class _StdinLines:
+    """Line reader over stdin that never leaves a thread parked in a read per prompt"""
+    
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        # Lines read ahead of a prompt stay queued, so a cancelled prompt
+        # doesn't swallow what the user typed for the next one
+        self.lines: asyncio.Queue = asyncio.Queue()
+        self._partial = b""
+        self._fd: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+    
+    def _decode(self, line: bytes) -> str:
+        return line.decode(sys.stdin.encoding or "utf-8", errors="replace")
+    
+    def _on_readable(self):
+        data = os.read(self._fd, 4096)
+        if not data:
+            self.loop.remove_reader(self._fd)
+            if self._partial:
+                self.lines.put_nowait(self._decode(self._partial))
+            self.lines.put_nowait(None)
+            return
+        
+        *complete, self._partial = (self._partial + data).split(b"\n")
+        for line in complete:
+            self.lines.put_nowait(self._decode(line))
+    
+    def _read_in_thread(self):
+        # One reader for the whole session, so no read is ever abandoned
+        while True:
+            line = sys.stdin.readline()
+            try:
+                self.loop.call_soon_threadsafe(self.lines.put_nowait, line.rstrip("\n") if line else None)
+            except RuntimeError:
+                return  # loop closed
+            if not line:
+                return
+    
+    def _listen(self) -> bool:
+        """Start delivering lines; True when stdin is watched by the loop itself"""
+        try:
+            fd = sys.stdin.fileno()
+            self.loop.add_reader(fd, self._on_readable)
+        except (NotImplementedError, OSError, ValueError):
+            # Proactor loops (Windows) and regular files can't be watched
+            self._thread = threading.Thread(target=self._read_in_thread, daemon=True)
+            self._thread.start()
+            return False
+        self._fd = fd
+        return True
+    
+    async def readline(self) -> str:
+        # Only watch stdin while a prompt is waiting on it
+        watching = self._thread is None and self.lines.empty() and self._listen()
+        try:
+            line = await self.lines.get()
+        finally:
+            if watching:
+                self.loop.remove_reader(self._fd)
+                self._fd = None
+        if line is None:
+            # Leave the marker for every later prompt
+            self.lines.put_nowait(None)
+            raise EOFError
+        return line
+
+_stdin: Optional[_StdinLines] = None
+
+async def ainput(prompt: str = "") -> str:
+    """input() that leaves the event loop free while waiting on the user"""
+    global _stdin
+    loop = asyncio.get_running_loop()
+    if _stdin is None or _stdin.loop is not loop:
+        _stdin = _StdinLines(loop)
+    sys.stdout.write(prompt)
+    sys.stdout.flush()
+    return await _stdin.readline()
+
 class ProactiveAIAgent:
     def __init__(self):
         self.vector_memory = VectorMemory()
         self.context_engine = ContextEngine(self.vector_memory)
         self.is_running = False
         self.last_poll_time = datetime.now()
+        
+        # Data sources push (source, data) updates here; the monitoring loop
+        # only wakes up when something actually arrives
+        self.update_queue: asyncio.Queue = asyncio.Queue()
+        self.calendar_server = None
+        self.calendar_poll_interval = 30
+        self.analysis_interval = 300
+        self.monitor_task: Optional[asyncio.Task] = None
+        # (context version, task) for lookups started ahead of option 3
+        self._context_prefetch: Optional[tuple] = None
     
     async def initialize(self):
         """Initialize the AI agent with real data sources"""
         logger.info("🚀 Initializing Proactive AI Agent...")
         
+        # Compile the search kernel in a worker thread while the calendar loads,
+        # so the first search doesn't pay the JIT cost
+        warmup = asyncio.create_task(asyncio.to_thread(self.vector_memory.warmup))
+        
         try:
             # Try to initialize with real calendar data
             await self._initialize_real_calendar()
@@ -34,6 +168,7 @@ class ProactiveAIAgent:
             logger.warning(f"⚠️  Real calendar not available, using demo data: {e}")
             await self._initialize_demo_data()
         
+        await warmup
         logger.info("✅ AI Agent initialized successfully!")
     
     async def _initialize_real_calendar(self):
@@ -45,8 +180,15 @@ class ProactiveAIAgent:
             
             from google_calendar_server import GoogleCalendarServer
             
-            calendar_server = GoogleCalendarServer()
-            events = await calendar_server.get_upcoming_events(20)  # Next 20 events
+            # Loading or refreshing credentials (or the OAuth flow) blocks
+            calendar_server = await asyncio.to_thread(GoogleCalendarServer)
+            try:
+                events = await calendar_server.get_upcoming_events(20)  # Next 20 events
+            except BaseException:
+                await calendar_server.close()
+                raise
+            
+            self.calendar_server = calendar_server
             
             if events:
                 await self.context_engine.update_context("calendar", events)
@@ -91,28 +233,36 @@ class ProactiveAIAgent:
     
     async def run_continuous_agent(self):
         """Run the continuous monitoring agent"""
+        if self.is_running:
+            print("ℹ️  Monitoring is already running")
+            return
         self.is_running = True
         logger.info("🔄 Starting continuous monitoring...")
-        logger.info("   This will check your calendar and provide proactive alerts every 30 seconds")
+        logger.info("   Alerts refresh as soon as new calendar data arrives")
         logger.info("   Press Ctrl+C to stop monitoring")
         
+        background = [asyncio.create_task(self._periodic_context_analysis())]
+        if self.calendar_server:
+            background.append(asyncio.create_task(self._poll_calendar()))
+        
         iteration = 0
+        last_version = None
         try:
             while self.is_running:
-                iteration += 1
-                print(f"\n--- Monitoring Cycle {iteration} ---")
-                
-                # Check for proactive alerts
-                await self._check_proactive_alerts()
-                
-                # Perform proactive context analysis
-                await self._proactive_context_analysis()
-                
-                # Update last poll time
-                self.last_poll_time = datetime.now()
+                # Only re-run alert checks when the stored context changed
+                if self.context_engine.version != last_version:
+                    last_version = self.context_engine.version
+                    iteration += 1
+                    logger.info(f"--- Monitoring Cycle {iteration} ---")
+                    
+                    await self._check_proactive_alerts()
+                    if iteration == 1:
+                        await self._proactive_context_analysis()
+                    self.last_poll_time = datetime.now()
                 
-                # Wait before next iteration
-                await asyncio.sleep(30)
+                # Block until a data source pushes an update
+                source, updates = await self.update_queue.get()
+                await self.context_engine.update_context(source, updates)
                 
         except KeyboardInterrupt:
             logger.info("🛑 Shutting down agent...")
@@ -120,45 +270,68 @@ class ProactiveAIAgent:
         except Exception as e:
             logger.error(f"❌ Error in main loop: {e}")
             self.is_running = False
+        finally:
+            self.is_running = False
+            for task in background:
+                task.cancel()
+    
+    async def _poll_calendar(self):
+        """Push changed calendar events onto the update queue"""
+        while self.is_running:
+            try:
+                # Incremental sync: idle polls return nothing and push nothing.
+                # Cancelled events go through too, so the engine can retract them.
+                changes = await self.calendar_server.get_event_changes()
+                if changes:
+                    await self.update_queue.put(("calendar", changes))
+            except Exception as e:
+                logger.error(f"Error polling calendar: {e}")
+            await asyncio.sleep(self.calendar_poll_interval)
+    
+    async def _periodic_context_analysis(self):
+        """Re-run the context analysis on a slow timer"""
+        while self.is_running:
+            await asyncio.sleep(self.analysis_interval)
+            await self._proactive_context_analysis()
     
     async def _check_proactive_alerts(self):
         """Check for and display proactive alerts"""
         try:
             # Get upcoming meetings in next 24 hours
-            upcoming = await self.context_engine.get_relevant_context("meeting today tomorrow", 10)
+            upcoming = await self.context_engine.get_relevant_context(
+                "meeting today tomorrow", 10, fields=("metadatas",), entity_type=ContextType.MEETING
+            )
             
-            current_time = datetime.now()
             alerts = []
             
             for item in upcoming:
                 metadata = item.get('metadata', {})
-                if metadata.get('type') == 'meeting':
-                    # Simple time-based alert logic
-                    content_str = item.get('document', '')
-                    if 'start_time' in content_str:
-                        # Extract time and check if it's within next 2 hours
-                        # For MVP, we'll create alerts for all upcoming meetings
-                        title = metadata.get('content', {}).get('title', 'Unknown meeting')
-                        
-                        alert = {
-                            "type": "MEETING_REMINDER",
-                            "title": f"Upcoming: {title}",
-                            "message": f"You have this meeting coming up",
-                            "priority": "MEDIUM",
-                            "suggestions": ["Review meeting details", "Prepare any materials"]
-                        }
-                        alerts.append(alert)
+                # Simple time-based alert logic
+                content_str = metadata.get('content', '')
+                if 'start_time' in content_str:
+                    # Extract time and check if it's within next 2 hours
+                    # For MVP, we'll create alerts for all upcoming meetings
+                    title = metadata.get('title') or 'Unknown meeting'
+                    
+                    alert = {
+                        "type": "MEETING_REMINDER",
+                        "title": f"Upcoming: {title}",
+                        "message": f"You have this meeting coming up",
+                        "priority": "MEDIUM",
+                        "suggestions": _MEETING_PREP_ACTIONS
+                    }
+                    alerts.append(alert)
             
-            # Display alerts
+            # Display alerts as one log record per cycle
             if alerts:
-                print("🚨 PROACTIVE ALERTS:")
+                lines = ["🚨 PROACTIVE ALERTS:"]
                 for alert in alerts:
-                    print(f"   📢 {alert['title']}")
-                    print(f"   💬 {alert['message']}")
-                    print(f"   ⚡ {alert['suggestions'][0]}")
-                    print()
+                    lines.append(f"   📢 {alert['title']}")
+                    lines.append(f"   💬 {alert['message']}")
+                    lines.append(f"   ⚡ {alert['suggestions'][0]}")
+                logger.info("\n".join(lines))
             else:
-                print("✅ No urgent alerts at this time")
+                logger.info("✅ No urgent alerts at this time")
                 
         except Exception as e:
             logger.error(f"Error checking alerts: {e}")
@@ -166,25 +339,32 @@ class ProactiveAIAgent:
     async def _proactive_context_analysis(self):
         """Perform proactive analysis of current context"""
         try:
+            # Independent lookups; run them concurrently
+            upcoming, celebrations = await asyncio.gather(
+                self.context_engine.get_relevant_context("meeting today", 5, fields=("metadatas",),
+                                                         entity_type=ContextType.MEETING),
+                self.context_engine.get_relevant_context("birthday anniversary", 3, fields=("metadatas",))
+            )
+            
+            lines = []
+            
             # Analyze upcoming meetings
-            upcoming = await self.context_engine.get_relevant_context("meeting today", 5)
             if upcoming:
-                print(f"📊 Context Analysis: {len(upcoming)} upcoming meetings today")
+                lines.append(f"📊 Context Analysis: {len(upcoming)} upcoming meetings today")
                 for item in upcoming[:3]:  # Show first 3
-                    doc = item.get('document', '')
-                    # Extract meeting title from document
-                    if "meeting: " in doc:
-                        title = doc.split("meeting: ")[1].split(",")[0]
-                        print(f"   • {title}")
+                    title = item.get('metadata', {}).get('title')
+                    if title:
+                        lines.append(f"   • {title}")
             
             # Look for birthday/anniversary alerts
-            celebrations = await self.context_engine.get_relevant_context("birthday anniversary", 3)
+            celebrations = [item for item in celebrations if item.get('metadata', {}).get('category') == 'celebration']
             if celebrations:
-                print(f"🎉 Upcoming celebrations: {len(celebrations)}")
+                lines.append(f"🎉 Upcoming celebrations: {len(celebrations)}")
                 for item in celebrations[:2]:
-                    doc = item.get('document', '')
-                    if "birthday" in doc.lower() or "anniversary" in doc.lower():
-                        print(f"   • {doc[:60]}...")
+                    lines.append(f"   • {item['metadata'].get('title', '')}")
+            
+            if lines:
+                logger.info("\n".join(lines))
                         
         except Exception as e:
             logger.error(f"Error in context analysis: {e}")
@@ -197,13 +377,13 @@ class ProactiveAIAgent:
         
         while True:
             try:
-                query = input("\n🔎 Enter search query: ").strip()
+                query = (await ainput("\n🔎 Enter search query: ")).strip()
                 if query.lower() in ['quit', 'exit', 'q']:
                     break
                 
                 if query:
                     print(f"   Searching for: '{query}'")
-                    results = await self.context_engine.get_relevant_context(query, 5)
+                    results = await self.context_engine.get_relevant_context(query, 5, fields=("metadatas", "documents"))
                     
                     if results:
                         print(f"   📖 Found {len(results)} results:")
@@ -221,65 +401,151 @@ class ProactiveAIAgent:
             except Exception as e:
                 logger.error(f"Search error: {e}")
     
+    async def _fetch_current_context(self):
+        """Run the lookups behind the current-context summary"""
+        return await asyncio.gather(
+            self.context_engine.get_relevant_context("meeting", 10, fields=("metadatas",),
+                                                     entity_type=ContextType.MEETING),
+            self.context_engine.get_relevant_context("birthday anniversary", 5, fields=("metadatas",))
+        )
+    
+    def prefetch_current_context(self):
+        """Start the current-context lookups in the background while the user decides"""
+        self.discard_context_prefetch()
+        self._context_prefetch = (
+            self.context_engine.version,
+            asyncio.create_task(self._fetch_current_context())
+        )
+    
+    def discard_context_prefetch(self):
+        """Cancel a prefetch that went unused"""
+        if self._context_prefetch:
+            self._context_prefetch[1].cancel()
+            self._context_prefetch = None
+    
     async def check_current_context(self):
         """Display current context summary"""
         print("\n📋 CURRENT CONTEXT SUMMARY")
         print("=" * 40)
         
+        prefetch, self._context_prefetch = self._context_prefetch, None
         try:
+            # Use the prefetched lookups unless the context changed since they started
+            if prefetch and prefetch[0] == self.context_engine.version:
+                recent, personal = await prefetch[1]
+            else:
+                if prefetch:
+                    prefetch[1].cancel()
+                recent, personal = await self._fetch_current_context()
+            
             # Get recent meetings
-            recent = await self.context_engine.get_relevant_context("meeting", 10)
             if recent:
                 print(f"📅 Recent/Upcoming Events: {len(recent)}")
                 for item in recent[:5]:
-                    doc = item.get('document', '')
-                    if "meeting: " in doc:
-                        # Extract clean title
-                        title_part = doc.split("meeting: ")[1]
-                        title = title_part.split(",")[0] if "," in title_part else title_part
+                    title = item.get('metadata', {}).get('title')
+                    if title:
                         print(f"   • {title}")
             
             # Get personal events
-            personal = await self.context_engine.get_relevant_context("birthday anniversary", 5)
+            personal = [item for item in personal if item.get('metadata', {}).get('category') == 'celebration']
             if personal:
                 print(f"\n🎊 Personal Events: {len(personal)}")
                 for item in personal[:3]:
-                    doc = item.get('document', '')
-                    print(f"   • {doc[:80]}...")
+                    print(f"   • {item['metadata'].get('title', '')}")
                     
         except Exception as e:
             logger.error(f"Error getting context: {e}")
 
+    async def start_background_monitoring(self):
+        """Run continuous monitoring as a task so the menu stays usable"""
+        if self.monitor_task and not self.monitor_task.done():
+            print("ℹ️  Background monitoring is already running")
+            return
+        self.monitor_task = asyncio.create_task(self.run_continuous_agent())
+        print("🛰️  Monitoring started in the background; alerts will appear in the log")
+    
+    async def status_and_search(self):
+        """Show the context summary while the search prompt is already open"""
+        results = await asyncio.gather(
+            self.check_current_context(),
+            self.interactive_search(),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Status + search failed: {result}")
+
 # For direct execution
-async def main():
-    """Main entry point when run directly"""
+async def main(handle_signals: bool = True):
+    """Main entry point when run directly; embedders pass handle_signals=False"""
     ai_agent = ProactiveAIAgent()
     
     print("🤖 Proactive Context-Awareness AI Agent")
     print("=" * 50)
     
-    await ai_agent.initialize()
+    # Load context in the background while the menu is shown and the user decides
+    init_task = asyncio.create_task(ai_agent.initialize())
     
-    while True:
-        print("\nOptions:")
-        print("1. Run continuous monitoring")
-        print("2. Interactive context search") 
-        print("3. Check current context")
-        print("4. Exit")
-        
-        choice = input("\nSelect option (1-4): ").strip()
-        
-        if choice == "1":
-            await ai_agent.run_continuous_agent()
-        elif choice == "2":
-            await ai_agent.interactive_search()
-        elif choice == "3":
-            await ai_agent.check_current_context()
-        elif choice == "4":
-            print("👋 Goodbye!")
+    # Built once; each turn is one write and one dict lookup
+    handlers = {
+        "1": ai_agent.run_continuous_agent,
+        "2": ai_agent.interactive_search,
+        "3": ai_agent.check_current_context,
+        "4": ai_agent.status_and_search,
+        "5": ai_agent.start_background_monitoring,
+    }
+    
+    # Ctrl+C / SIGTERM cancel every task at once, so monitoring loops,
+    # pollers and in-flight requests unwind immediately instead of timing out
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM) if handle_signals else ():
+        try:
+            loop.add_signal_handler(sig, _cancel_all_tasks)
+        except (NotImplementedError, RuntimeError):
+            # Windows loops don't support signal handlers; keep the default behavior
             break
-        else:
-            print("❌ Invalid choice")
+    
+    # Blocking calls show up as late wake-ups of this watchdog rather than
+    # as silent stalls; wall-clock timing of a handler can't tell the two apart
+    current_step = ["menu"]
+    lag_watch = asyncio.create_task(_watch_loop_lag(current_step))
+    
+    try:
+        while True:
+            current_step[0] = "menu"
+            # Use the user's think time to run the current-context lookups
+            if init_task.done() and not init_task.cancelled() and init_task.exception() is None:
+                ai_agent.prefetch_current_context()
+            sys.stdout.write(MENU)
+            choice = (await ainput("\nSelect option (1-6): ")).strip()
+            
+            handler = handlers.get(choice)
+            if handler:
+                current_step[0] = handler.__name__
+                # Waits out a pending initialization and re-raises a failed one
+                await init_task
+                await handler()
+                ai_agent.discard_context_prefetch()
+            elif choice == "6":
+                print("👋 Goodbye!")
+                break
+            else:
+                print("❌ Invalid choice")
+    except asyncio.CancelledError:
+        logger.info("🛑 Shutting down agent...")
+    finally:
+        # Also runs when stdin closes, initialization fails or a handler raises
+        lag_watch.cancel()
+        ai_agent.discard_context_prefetch()
+        init_task.cancel()
+        if ai_agent.monitor_task:
+            ai_agent.monitor_task.cancel()
+        if ai_agent.calendar_server:
+            await ai_agent.calendar_server.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    # libuv-backed loop when available; stdlib asyncio otherwise (e.g. Windows)
+    if uvloop is not None and getattr(sys, "_is_gil_enabled", lambda: True)():
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
\ No newline at end of file
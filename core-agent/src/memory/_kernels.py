@@ -0,0 +1,70 @@
+import numpy as np
+from typing import Tuple
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+if njit is not None:
+    # Serial on purpose: the in-memory matrix is capped at memory_index_limit
+    # rows, so a thread pool buys nothing, and numba's parallel layers (TBB in
+    # particular) hang interpreter shutdown once first run off the main thread
+    @njit(fastmath=True, cache=True)
+    def _cosine_topk(matrix, q, k):
+        n, dim = matrix.shape
+        scores = np.empty(n, dtype=np.float32)
+        # Row-major scan: each row is one contiguous, vectorizable dot product
+        for i in range(n):
+            s = np.float32(0.0)
+            for j in range(dim):
+                s += matrix[i, j] * q[j]
+            scores[i] = s
+
+        # Keep the k best in a small sorted buffer; most rows fail the first
+        # comparison, so this stays close to a single pass
+        k = min(k, n)
+        top = np.empty(k, dtype=np.int64)
+        top_scores = np.full(k, -np.inf, dtype=np.float32)
+        for i in range(n):
+            s = scores[i]
+            if s <= top_scores[k - 1]:
+                continue
+            pos = k - 1
+            while pos > 0 and top_scores[pos - 1] < s:
+                top_scores[pos] = top_scores[pos - 1]
+                top[pos] = top[pos - 1]
+                pos -= 1
+            top_scores[pos] = s
+            top[pos] = i
+        return top, top_scores
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first, without sorting the rest"""
+    n = len(scores)
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+    top = np.argpartition(-scores, k - 1)[:k] if k < n else np.arange(n)
+    return top[np.argsort(-scores[top])]
+
+def cosine_topk(matrix: np.ndarray, q: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Indices and scores of the k rows most similar to q, best first"""
+    k = min(k, matrix.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float32)
+    q = np.ascontiguousarray(q, dtype=np.float32)
+    if njit is not None:
+        return _cosine_topk(matrix, q, k)
+
+    scores = matrix @ q
+    top = top_k(scores, k)
+    return top, scores[top]
+
+def warmup(dim: int) -> None:
+    """Compile the kernel ahead of the first query"""
+    if njit is not None:
+        # Query embeddings are cached read-only, which numba types separately
+        q = np.zeros(dim, dtype=np.float32)
+        q.setflags(write=False)
+        cosine_topk(np.zeros((2, dim), dtype=np.float32), q, 1)
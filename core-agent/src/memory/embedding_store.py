@@ -0,0 +1,116 @@
+import numpy as np
+from typing import List, Dict, Tuple
+import hashlib
+import os
+import sqlite3
+import threading
+
+# Symmetric scalar quantization for unit-normalized embeddings: every
+# component lies in [-1, 1], so one fixed scale maps it onto int8
+QUANT_SCALE = 127
+
+def quantize(embeddings) -> np.ndarray:
+    """Quantize unit-normalized float embeddings to int8 codes"""
+    return np.clip(np.round(np.asarray(embeddings, dtype=np.float32) * QUANT_SCALE), -QUANT_SCALE, QUANT_SCALE).astype(np.int8)
+
+def dequantize(codes: np.ndarray) -> np.ndarray:
+    """Recover float32 embeddings from int8 codes"""
+    return codes.astype(np.float32) / QUANT_SCALE
+
+class EmbeddingStore:
+    """Int8-quantized embedding side-table backed by a numpy memmap and a SQLite id->row map"""
+
+    def __init__(self, path: str, model: str, dim: int = 384, initial_rows: int = 1024):
+        self.path = path
+        self.model = model
+        self.dim = dim
+        # Called from worker threads; one connection and memmap, so serialize access
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(f"{path}.idx", check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS rows ("
+            "id TEXT PRIMARY KEY, row INTEGER NOT NULL, digest TEXT NOT NULL)"
+        )
+        self.conn.commit()
+
+        # Next free row; deleted ids leave gaps, so this is not the row count
+        self.count = self.conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM rows").fetchone()[0]
+        self.vectors = None
+        stored_rows = 0
+        if os.path.exists(path):
+            stored_rows = os.path.getsize(path) // (dim * np.dtype(np.int8).itemsize)
+        self._open(max(initial_rows, self.count, stored_rows))
+
+    def _open(self, rows: int) -> None:
+        """Map the side-table file, growing it on disk to hold `rows` vectors"""
+        size = rows * self.dim * np.dtype(np.int8).itemsize
+        if not os.path.exists(self.path) or os.path.getsize(self.path) < size:
+            with open(self.path, 'ab') as f:
+                f.truncate(size)
+
+        if self.vectors is not None:
+            self.vectors.flush()
+        self.vectors = np.memmap(self.path, dtype=np.int8, mode='r+', shape=(rows, self.dim))
+
+    def get_many(self, ids: List[str], texts: List[str]) -> Dict[str, np.ndarray]:
+        """Return persisted embeddings for ids whose text is unchanged"""
+        digests = dict(zip(ids, map(self._digest, texts)))
+        with self._lock:
+            return {
+                entity_id: dequantize(self.vectors[row])
+                for entity_id, (row, digest) in self._lookup(ids).items()
+                if digests[entity_id] == digest
+            }
+
+    def put_many(self, ids: List[str], texts: List[str], embeddings: np.ndarray) -> None:
+        """Persist embeddings, reusing the existing row for known ids"""
+        with self._lock:
+            existing = {entity_id: row for entity_id, (row, _) in self._lookup(ids).items()}
+
+            rows = []
+            for entity_id in ids:
+                if entity_id not in existing:
+                    existing[entity_id] = self.count
+                    self.count += 1
+                rows.append(existing[entity_id])
+
+            capacity = self.vectors.shape[0]
+            if self.count > capacity:
+                while capacity < self.count:
+                    capacity *= 2
+                self._open(capacity)
+
+            self.vectors[rows] = quantize(embeddings)
+            self.vectors.flush()
+
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO rows (id, row, digest) VALUES (?, ?, ?)",
+                [(entity_id, row, self._digest(text)) for entity_id, row, text in zip(ids, rows, texts)]
+            )
+            self.conn.commit()
+
+    def delete_many(self, ids: List[str]) -> None:
+        """Forget persisted embeddings; their rows are left unused in the file"""
+        with self._lock:
+            self.conn.executemany("DELETE FROM rows WHERE id = ?", [(entity_id,) for entity_id in ids])
+            self.conn.commit()
+
+    def _lookup(self, ids: List[str]) -> Dict[str, Tuple[int, str]]:
+        """Map known ids to their (row, digest)"""
+        found = {}
+        # Stay under SQLite's default bound-parameter limit
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            for entity_id, row, digest in self.conn.execute(
+                f"SELECT id, row, digest FROM rows WHERE id IN ({placeholders})", chunk
+            ):
+                found[entity_id] = (row, digest)
+        return found
+
+    def _digest(self, text: str) -> str:
+        """Fingerprint the model and embedded text so edited entities, or vectors
+        from a different encoder, are re-encoded"""
+        return hashlib.sha1(f"{self.model}\0{text}".encode()).hexdigest()
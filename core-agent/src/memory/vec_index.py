@@ -0,0 +1,127 @@
+import numpy as np
+from typing import List, Dict, Any, Tuple, Optional
+import orjson
+import os
+import sqlite3
+import threading
+
+class VecIndex:
+    """sqlite-vec k-NN index mirroring the Chroma collection"""
+
+    def __init__(self, path: str, dim: int = 384):
+        # Called from worker threads; serialize use of the shared connection
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.enable_load_extension(True)
+        try:
+            try:
+                import sqlite_vec
+                sqlite_vec.load(self.conn)
+            except ImportError:
+                self.conn.load_extension("vec0")
+        finally:
+            self.conn.enable_load_extension(False)
+
+        # The index is derived from Chroma; an older layout without the type
+        # column is dropped and refilled by the owner's backfill
+        schema = self.conn.execute(
+            "SELECT sql FROM sqlite_master WHERE name = 'vec_chunks'"
+        ).fetchone()
+        if schema and "entity_type" not in schema[0]:
+            self.conn.execute("DROP TABLE vec_chunks")
+            self.conn.execute("DROP TABLE IF EXISTS vec_entities")
+
+        # entity_type is a vec0 metadata column, so type filters apply inside
+        # the k-NN scan rather than after the top k is cut
+        self.conn.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS vec_chunks "
+            f"USING vec0(embedding float[{dim}] distance_metric=cosine, entity_type text)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS vec_entities ("
+            "rowid INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, "
+            "metadata TEXT NOT NULL, document TEXT NOT NULL)"
+        )
+        self.conn.commit()
+
+    def count(self) -> int:
+        """Number of indexed entities"""
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM vec_entities").fetchone()[0]
+
+    def clear(self) -> None:
+        """Remove every entity from the index"""
+        with self._lock:
+            self.conn.execute("DELETE FROM vec_chunks")
+            self.conn.execute("DELETE FROM vec_entities")
+            self.conn.commit()
+
+    def add(self, ids: List[str], embeddings, metadatas: List[Dict[str, Any]], documents: List[str]) -> None:
+        """Insert or replace entities in the index"""
+        with self._lock:
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+            for entity_id, embedding, metadata, document in zip(ids, embeddings, metadatas, documents):
+                row = self.conn.execute(
+                    "SELECT rowid FROM vec_entities WHERE id = ?", (entity_id,)
+                ).fetchone()
+                if row:
+                    rowid = row[0]
+                    self.conn.execute(
+                        "UPDATE vec_entities SET metadata = ?, document = ? WHERE rowid = ?",
+                        (orjson.dumps(metadata), document, rowid)
+                    )
+                    self.conn.execute("DELETE FROM vec_chunks WHERE rowid = ?", (rowid,))
+                else:
+                    rowid = self.conn.execute(
+                        "INSERT INTO vec_entities (id, metadata, document) VALUES (?, ?, ?)",
+                        (entity_id, orjson.dumps(metadata), document)
+                    ).lastrowid
+                self.conn.execute(
+                    "INSERT INTO vec_chunks (rowid, embedding, entity_type) VALUES (?, ?, ?)",
+                    (rowid, embedding.tobytes(), metadata.get("type", ""))
+                )
+            self.conn.commit()
+
+    def delete(self, ids: List[str]) -> None:
+        """Remove entities from the index"""
+        with self._lock:
+            for entity_id in ids:
+                row = self.conn.execute(
+                    "SELECT rowid FROM vec_entities WHERE id = ?", (entity_id,)
+                ).fetchone()
+                if row:
+                    self.conn.execute("DELETE FROM vec_chunks WHERE rowid = ?", row)
+                    self.conn.execute("DELETE FROM vec_entities WHERE rowid = ?", row)
+            self.conn.commit()
+
+    def search(self, query_embedding, k: int = 5,
+               fields: Tuple[str, ...] = ("metadatas", "documents"),
+               entity_type: Optional[str] = None) -> List[Dict]:
+        """Return the k nearest entities in Chroma's result shape, reading only the requested columns"""
+        with_metadata = "metadatas" in fields
+        with_document = "documents" in fields
+        params = [np.asarray(query_embedding, dtype=np.float32).tobytes(), k]
+        if entity_type is not None:
+            params.append(entity_type)
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT e.id, {'e.metadata' if with_metadata else 'NULL'}, "
+                f"{'e.document' if with_document else 'NULL'}, v.distance "
+                "FROM (SELECT rowid, distance FROM vec_chunks WHERE embedding MATCH ? AND k = ?"
+                f"{' AND entity_type = ?' if entity_type is not None else ''}) v "
+                "JOIN vec_entities e ON e.rowid = v.rowid "
+                "ORDER BY v.distance",
+                params
+            ).fetchall()
+
+        results = []
+        for entity_id, metadata, document, distance in rows:
+            result = {"id": entity_id, "distance": distance}
+            if with_metadata:
+                result["metadata"] = orjson.loads(metadata)
+            if with_document:
+                result["document"] = document
+            results.append(result)
+        return results
@@ -2,62 +2,482 @@ import chromadb
 from chromadb.config import Settings
 from sentence_transformers import SentenceTransformer
 import numpy as np
-from typing import List, Dict, Any
-import json
+import torch
+from typing import List, Dict, Any, Set, Tuple, Optional
+from collections import OrderedDict
+import asyncio
 import logging
+import orjson
+import os
+import threading
+
+from . import _kernels
+from .embedding_store import EmbeddingStore
+from .vec_index import VecIndex
+
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+
+# One encoder per process, shared by every VectorMemory instance
+_ENCODER: Optional[Tuple[str, SentenceTransformer]] = None
+_ENCODER_LOCK = threading.Lock()
+
+def _select_device() -> str:
+    """Pick the fastest available device for the encoder"""
+    if torch.cuda.is_available():
+        return 'cuda'
+    if torch.backends.mps.is_available():
+        return 'mps'
+    return 'cpu'
+
+def _load_encoder(device: str) -> Tuple[str, SentenceTransformer]:
+    """Load the sentence encoder; on CPU prefer the int8-quantized ONNX export"""
+    if device == 'cpu' and os.getenv("EMBEDDING_BACKEND", "onnx").lower() == "onnx":
+        onnx_file = os.getenv("EMBEDDING_ONNX_FILE", "onnx/model_quint8_avx2.onnx")
+        try:
+            return f"{EMBEDDING_MODEL}/{onnx_file}", SentenceTransformer(
+                EMBEDDING_MODEL,
+                backend="onnx",
+                model_kwargs={
+                    "file_name": onnx_file,
+                    "provider": "CPUExecutionProvider",
+                }
+            )
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"ONNX encoder unavailable, loading PyTorch model: {e}")
+    model = SentenceTransformer(EMBEDDING_MODEL, device=device)
+    if device in ('cuda', 'mps'):
+        # fp16 weights halve memory and forward-pass bandwidth on accelerators
+        model.half()
+    else:
+        torch.set_num_threads(os.cpu_count() or 1)
+        torch.set_float32_matmul_precision('medium')
+    return EMBEDDING_MODEL, model
+
+def _get_encoder() -> Tuple[str, SentenceTransformer]:
+    """Return the process-wide (model key, encoder), loading it on first use"""
+    global _ENCODER
+    with _ENCODER_LOCK:
+        if _ENCODER is None:
+            _ENCODER = _load_encoder(_select_device())
+        return _ENCODER
+
+# LRU of query embeddings keyed on (model, query), so swaps never mix vectors.
+# Checked on the event loop; only misses pay for a worker thread.
+_QUERY_EMBEDDINGS: OrderedDict = OrderedDict()
+_QUERY_EMBEDDINGS_SIZE = 512
+
+async def _embed_query(model_name: str, query: str) -> np.ndarray:
+    """Embed a query string, encoding off the event loop on a cache miss"""
+    key = (model_name, query)
+    cached = _QUERY_EMBEDDINGS.get(key)
+    if cached is not None:
+        _QUERY_EMBEDDINGS.move_to_end(key)
+        return cached
+    
+    _, encoder = _get_encoder()
+    embedding = await asyncio.to_thread(
+        encoder.encode, query, normalize_embeddings=True, show_progress_bar=False
+    )
+    embedding = np.asarray(embedding, dtype=np.float32)
+    embedding.setflags(write=False)
+    
+    _QUERY_EMBEDDINGS[key] = embedding
+    if len(_QUERY_EMBEDDINGS) > _QUERY_EMBEDDINGS_SIZE:
+        _QUERY_EMBEDDINGS.popitem(last=False)
+    return embedding
 
 class VectorMemory:
-    def __init__(self, persist_directory: str = "./data/chroma"):
+    def __init__(self, persist_directory: str = "./data/chroma", vec_db_path: Optional[str] = None,
+                 sim_cache_threshold: float = 0.95, sim_cache_size: int = 64,
+                 memory_index_limit: int = 50_000):
         self.client = chromadb.PersistentClient(path=persist_directory)
-        self.collection = self.client.get_or_create_collection("context_entities")
-        self.encoder = SentenceTransformer('all-MiniLM-L6-v2')
+        # Cosine space on unit-normalized embeddings; ef_search sized for the
+        # k=5-10 lookups the agent issues
+        self.collection = self.client.get_or_create_collection(
+            "context_entities",
+            configuration={
+                "hnsw": {
+                    "space": "cosine",
+                    "max_neighbors": 32,
+                    "ef_construction": 200,
+                    "ef_search": 64,
+                }
+            }
+        )
+        self.model_name, self.encoder = _get_encoder()
         self.logger = logging.getLogger(__name__)
+        
+        # Persisted embeddings inside the Chroma directory, so a restart does
+        # not re-encode entities whose content hasn't changed, and the
+        # side-table is removed or rebuilt together with the store it mirrors
+        self.embedding_store = EmbeddingStore(
+            os.path.join(persist_directory, "embeddings.i8"),
+            model=self.model_name,
+            dim=self.encoder.get_sentence_embedding_dimension()
+        )
+        
+        # Most-recent-first (query embedding, k, fields, entity type, results) entries; a new query
+        # close enough to a cached one reuses its results without searching
+        self.sim_cache_threshold = sim_cache_threshold
+        self.sim_cache_size = sim_cache_size
+        self._sim_cache: List[Tuple[np.ndarray, int, Tuple[str, ...], Optional[str], List[Dict]]] = []
+        
+        # Stores are serialized; searches compare generations so results that
+        # raced a store are never cached
+        self._write_lock = asyncio.Lock()
+        self._generation = 0
+        
+        # Small corpora are searched with one mat-vec over an in-memory mirror
+        # of the store; past memory_index_limit rows the persistent indexes take over
+        self.memory_index_limit = memory_index_limit
+        self._matrix: Optional[np.ndarray] = None
+        self._ids: List[str] = []
+        self._id_rows: Dict[str, int] = {}
+        self._metadatas: List[Dict[str, Any]] = []
+        self._documents: List[str] = []
+        self._types = np.empty(0, dtype=object)
+        self._load_memory_index()
+        
+        # sqlite-vec serves k-NN queries once the mirror is dropped; Chroma stays
+        # the source of truth and the fallback search backend. Kept next to the
+        # Chroma files so the two are removed or rebuilt together.
+        self.vec_index = None
+        if os.getenv("USE_VEC_INDEX", "true").lower() == "true":
+            try:
+                self.vec_index = VecIndex(
+                    vec_db_path or os.path.join(persist_directory, "vec.db"),
+                    dim=self.encoder.get_sentence_embedding_dimension()
+                )
+                self._sync_vec_index()
+            except Exception as e:
+                self.logger.warning(f"sqlite-vec index unavailable, searching Chroma instead: {e}")
+                self.vec_index = None
+    
+    def warmup(self) -> None:
+        """Compile the JIT scan kernel ahead of the first query; blocking, run it off the loop"""
+        _kernels.warmup(self.encoder.get_sentence_embedding_dimension())
     
     async def store_entity(self, entity) -> None:
         """Store entity in vector database"""
+        await self.bulk_store_entities([entity])
+    
+    async def bulk_store_entities(self, entities: List[Any]) -> None:
+        """Store a batch of entities with one encode pass and one Chroma write"""
+        if not entities:
+            return
         try:
-            # Create embedding from entity content
-            text_content = self._entity_to_text(entity)
-            embedding = self.encoder.encode(text_content)
-            
-            self.collection.add(
-                ids=[entity.id],
-                embeddings=[embedding.tolist()],
-                metadatas=[{
-                    "type": entity.type,
-                    "timestamp": entity.timestamp.isoformat(),
-                    "importance": entity.importance,
-                }],
-                documents=[text_content]
-            )
-            self.logger.info(f"Stored entity: {entity.id}")
+            async with self._write_lock:
+                # Serialize each entity's content once for both the text and the metadata
+                contents = [orjson.dumps(entity.content).decode() for entity in entities]
+                texts = [self._entity_to_text(entity, content) for entity, content in zip(entities, contents)]
+                
+                pending = [i for i, entity in enumerate(entities) if entity.embedding is None]
+                if pending:
+                    persisted = await asyncio.to_thread(
+                        self.embedding_store.get_many,
+                        [entities[i].id for i in pending], [texts[i] for i in pending]
+                    )
+                    for i in pending:
+                        entities[i].embedding = persisted.get(entities[i].id)
+                
+                # Only entities that are new or whose content changed hit the encoder
+                to_encode = [i for i, entity in enumerate(entities) if entity.embedding is None]
+                if to_encode:
+                    fresh = await asyncio.to_thread(
+                        self.encoder.encode,
+                        [texts[i] for i in to_encode],
+                        batch_size=32,
+                        convert_to_numpy=True,
+                        normalize_embeddings=True,
+                        show_progress_bar=False
+                    )
+                    # Half-precision models return fp16; everything downstream expects fp32
+                    fresh = np.asarray(fresh, dtype=np.float32)
+                    for i, embedding in zip(to_encode, fresh):
+                        entities[i].embedding = embedding
+                
+                embeddings = np.stack([entity.embedding for entity in entities])
+                ids = [entity.id for entity in entities]
+                metadatas = [self._entity_metadata(entity, content) for entity, content in zip(entities, contents)]
+                
+                await asyncio.to_thread(self._write_stores, ids, embeddings, metadatas, texts)
+                # The in-memory mirror is only ever touched from the event loop
+                mirrored = self._matrix is not None
+                self._update_memory_index(ids, embeddings, metadatas, texts)
+                if mirrored and self._matrix is None and self.vec_index is not None:
+                    # Searches move to the persistent index, which the mirror kept empty
+                    try:
+                        await asyncio.to_thread(self._sync_vec_index)
+                    except Exception as e:
+                        self.logger.warning(f"sqlite-vec index unavailable, searching Chroma instead: {e}")
+                        self.vec_index = None
+                
+                # Recorded last: a side-table row means the entity reached the store
+                if to_encode:
+                    await asyncio.to_thread(
+                        self.embedding_store.put_many,
+                        [entities[i].id for i in to_encode], [texts[i] for i in to_encode], fresh
+                    )
+                self._generation += 1
+                self._sim_cache.clear()
+            self.logger.info(f"Stored {len(entities)} entities")
         except Exception as e:
-            self.logger.error(f"Error storing entity: {e}")
+            self.logger.error(f"Error storing entities: {e}")
     
-    async def similarity_search(self, query: str, k: int = 5) -> List[Dict]:
-        """Search for similar entities"""
+    def _write_stores(self, ids: List[str], embeddings: np.ndarray, metadatas: List[Dict[str, Any]],
+                      documents: List[str]) -> None:
+        """Blocking writes to Chroma, and to the sqlite-vec index unless the mirror serves searches"""
+        self.collection.upsert(
+            ids=ids,
+            embeddings=embeddings,
+            metadatas=metadatas,
+            documents=documents
+        )
+        if self.vec_index is not None and self._matrix is None:
+            self.vec_index.add(ids, embeddings, metadatas, documents)
+    
+    async def delete_entities(self, ids: List[str]) -> None:
+        """Remove entities from every store and the in-memory mirror"""
+        if not ids:
+            return
+        try:
+            async with self._write_lock:
+                await asyncio.to_thread(self._delete_from_stores, ids)
+                self._delete_from_memory_index(ids)
+                self._generation += 1
+                self._sim_cache.clear()
+            self.logger.info(f"Deleted {len(ids)} entities")
+        except Exception as e:
+            self.logger.error(f"Error deleting entities: {e}")
+    
+    def _delete_from_stores(self, ids: List[str]) -> None:
+        """Blocking deletes from Chroma, the sqlite-vec index and the embedding side-table"""
+        self.collection.delete(ids=ids)
+        if self.vec_index is not None and self._matrix is None:
+            self.vec_index.delete(ids)
+        self.embedding_store.delete_many(ids)
+    
+    async def unchanged_ids(self, entities: List[Any]) -> Set[str]:
+        """Ids of entities already stored with identical content"""
+        texts = {entity.id: self._entity_to_text(entity) for entity in entities}
+        # Checked against the collection itself, so a lost or rebuilt store is
+        # refilled instead of every entity being reported as unchanged
+        stored = await asyncio.to_thread(
+            self.collection.get, ids=list(texts), include=["documents"]
+        )
+        return {
+            entity_id
+            for entity_id, document in zip(stored["ids"], stored["documents"])
+            if texts.get(entity_id) == document
+        }
+    
+    async def similarity_search(self, query: str, k: int = 5,
+                                fields: Tuple[str, ...] = ("metadatas", "distances"),
+                                entity_type: Optional[str] = None) -> List[Dict]:
+        """Search for similar entities, fetching only the requested result fields;
+        entity_type restricts the search to one ContextType value before the top k is taken"""
         try:
-            query_embedding = self.encoder.encode(query).tolist()
+            # The agent loops re-issue the same handful of queries every cycle
+            query_embedding = await _embed_query(self.model_name, query)
             
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=k,
-                include=["metadatas", "documents", "distances"]
-            )
+            cached = self._sim_cache_lookup(query_embedding, k, fields, entity_type)
+            if cached is not None:
+                return cached
             
-            return [
-                {
-                    "id": results["ids"][0][i],
-                    "metadata": results["metadatas"][0][i],
-                    "document": results["documents"][0][i],
-                    "distance": results["distances"][0][i]
-                }
-                for i in range(len(results["ids"][0]))
-            ]
+            generation = self._generation
+            if self._matrix is not None:
+                results = self._memory_search(query_embedding, k, entity_type)
+            else:
+                results = await asyncio.to_thread(self._persistent_search, query_embedding, k, fields, entity_type)
+            
+            # Skip caching if a store landed while this search was in flight
+            if results and generation == self._generation:
+                self._sim_cache.insert(0, (query_embedding, k, fields, entity_type, results))
+                del self._sim_cache[self.sim_cache_size:]
+            return results
         except Exception as e:
             self.logger.error(f"Error in similarity search: {e}")
             return []
     
-    def _entity_to_text(self, entity) -> str:
+    def _sim_cache_lookup(self, query_embedding: np.ndarray, k: int, fields: Tuple[str, ...],
+                          entity_type: Optional[str]) -> Optional[List[Dict]]:
+        """Return cached results for the nearest previous query above the threshold"""
+        if not self._sim_cache:
+            return None
+        
+        # Embeddings are unit-normalized, so one mat-vec gives every cosine similarity
+        keys = np.stack([entry[0] for entry in self._sim_cache])
+        scores = keys @ query_embedding
+        # Entries with fewer results, fewer fields or another type filter than
+        # asked for can't answer; distances are in every result
+        wanted = set(fields) - {"distances"}
+        scores[[
+            entry[1] < k or not wanted <= set(entry[2]) or entry[3] != entity_type
+            for entry in self._sim_cache
+        ]] = -np.inf
+        best = int(np.argmax(scores))
+        if scores[best] < self.sim_cache_threshold:
+            return None
+        
+        entry = self._sim_cache.pop(best)
+        self._sim_cache.insert(0, entry)
+        return entry[4][:k]
+    
+    def _memory_search(self, query_embedding: np.ndarray, k: int,
+                       entity_type: Optional[str] = None) -> List[Dict]:
+        """Exact top-k over the in-memory matrix, with every field since they're already in memory"""
+        if not self._ids:
+            return []
+        
+        if entity_type is None:
+            top, scores = _kernels.cosine_topk(self._matrix, query_embedding, k)
+        else:
+            # Score every row, then rank only the rows of the requested type
+            rows = np.flatnonzero(self._types == entity_type)
+            scores = self._matrix @ query_embedding
+            top = rows[_kernels.top_k(scores[rows], k)]
+            scores = scores[top]
+        
+        return [
+            {
+                "id": self._ids[i],
+                "metadata": self._metadatas[i],
+                "document": self._documents[i],
+                "distance": float(1.0 - score)
+            }
+            for i, score in zip(top.tolist(), scores.tolist())
+        ]
+    
+    def _persistent_search(self, query_embedding: np.ndarray, k: int, fields: Tuple[str, ...],
+                           entity_type: Optional[str] = None) -> List[Dict]:
+        """Blocking k-NN over sqlite-vec, falling back to Chroma; both return exact cosine distances"""
+        if self.vec_index is not None:
+            try:
+                return self.vec_index.search(query_embedding, k, fields, entity_type)
+            except Exception as e:
+                self.logger.error(f"Error in sqlite-vec search, falling back to Chroma: {e}")
+        
+        # Distances are always needed to rank; documents only when a caller reads them
+        include = [field for field in ("metadatas", "documents") if field in fields] + ["distances"]
+        results = self.collection.query(
+            query_embeddings=[query_embedding.tolist()],
+            n_results=k,
+            where={"type": entity_type} if entity_type is not None else None,
+            include=include
+        )
+        
+        # Unwrap each single-query column once, then build rows with one zip
+        columns = {"id": results["ids"][0], "distance": results["distances"][0]}
+        if "metadatas" in fields:
+            columns["metadata"] = results["metadatas"][0]
+        if "documents" in fields:
+            columns["document"] = results["documents"][0]
+        keys = tuple(columns)
+        return [dict(zip(keys, row)) for row in zip(*columns.values())]
+    
+    def _load_memory_index(self) -> None:
+        """Mirror the Chroma collection into memory when it is small enough"""
+        dim = self.encoder.get_sentence_embedding_dimension()
+        if self.collection.count() > self.memory_index_limit:
+            return
+        
+        self._matrix = np.empty((0, dim), dtype=np.float32)
+        existing = self.collection.get(include=["embeddings", "metadatas", "documents"])
+        if existing["ids"]:
+            self._update_memory_index(
+                existing["ids"], existing["embeddings"], existing["metadatas"], existing["documents"]
+            )
+    
+    def _update_memory_index(self, ids: List[str], embeddings, metadatas: List[Dict[str, Any]],
+                             documents: List[str]) -> None:
+        """Upsert rows into the in-memory mirror, dropping it once it outgrows the limit"""
+        if self._matrix is None:
+            return
+        
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        new_rows, new_types = [], []
+        for entity_id, embedding, metadata, document in zip(ids, embeddings, metadatas, documents):
+            row = self._id_rows.get(entity_id)
+            if row is None:
+                self._id_rows[entity_id] = len(self._ids)
+                self._ids.append(entity_id)
+                self._metadatas.append(metadata)
+                self._documents.append(document)
+                new_rows.append(embedding)
+                new_types.append(metadata.get("type"))
+            else:
+                self._matrix[row] = embedding
+                self._metadatas[row] = metadata
+                self._documents[row] = document
+                self._types[row] = metadata.get("type")
+        
+        if new_rows:
+            self._matrix = np.concatenate([self._matrix, np.stack(new_rows)])
+            self._types = np.concatenate([self._types, np.array(new_types, dtype=object)])
+        
+        if len(self._ids) > self.memory_index_limit:
+            self.logger.info("In-memory index limit reached, searching the persistent index")
+            self._matrix = None
+            self._ids, self._id_rows, self._metadatas, self._documents = [], {}, [], []
+            self._types = np.empty(0, dtype=object)
+    
+    def _delete_from_memory_index(self, ids: List[str]) -> None:
+        """Remove rows from the in-memory mirror, moving the last row into each gap"""
+        if self._matrix is None:
+            return
+        
+        for entity_id in ids:
+            row = self._id_rows.pop(entity_id, None)
+            if row is None:
+                continue
+            last = len(self._ids) - 1
+            if row != last:
+                moved = self._ids[last]
+                self._id_rows[moved] = row
+                self._ids[row] = moved
+                self._matrix[row] = self._matrix[last]
+                self._metadatas[row] = self._metadatas[last]
+                self._documents[row] = self._documents[last]
+                self._types[row] = self._types[last]
+            self._ids.pop()
+            self._metadatas.pop()
+            self._documents.pop()
+            self._matrix = self._matrix[:last]
+            self._types = self._types[:last]
+    
+    def _sync_vec_index(self) -> None:
+        """Blocking: empty the sqlite-vec index while the mirror serves searches,
+        otherwise rebuild it from Chroma if the two have drifted apart"""
+        if self._matrix is not None:
+            # Not written while unused, so don't leave stale rows for later
+            if self.vec_index.count():
+                self.vec_index.clear()
+            return
+        
+        # Writes keep the index in step from here on; a count mismatch means
+        # rows were missed (first run, a crash, a previous mirrored session)
+        if self.vec_index.count() == self.collection.count():
+            return
+        self.vec_index.clear()
+        existing = self.collection.get(include=["embeddings", "metadatas", "documents"])
+        self.vec_index.add(
+            existing["ids"], existing["embeddings"], existing["metadatas"], existing["documents"]
+        )
+        self.logger.info(f"Rebuilt the sqlite-vec index from {len(existing['ids'])} stored entities")
+    
+    def _entity_metadata(self, entity, content_json: str) -> Dict[str, Any]:
+        """Build the Chroma metadata record for an entity"""
+        return {
+            "type": entity.type.value,
+            "title": entity.content.get("title", ""),
+            "category": entity.content.get("category", "event"),
+            "content": content_json,
+            "timestamp": entity.timestamp.isoformat(),
+            "importance": entity.importance,
+        }
+    
+    def _entity_to_text(self, entity, content_json: Optional[str] = None) -> str:
         """Convert entity to text for embedding"""
-        return f"{entity.type}: {entity.content}"
\ No newline at end of file
+        if content_json is None:
+            content_json = orjson.dumps(entity.content).decode()
+        return f"{entity.type.value}: {content_json}"
\ No newline at end of file
@@ -1,23 +1,34 @@
 import os
 import asyncio
-from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Optional, Tuple
 import logging
 
+import aiohttp
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 
 # If modifying these SCOPES, delete the file token.json.
 SCOPES = ['https://www.googleapis.com/auth/calendar.readonly']
 
+EVENTS_URL = 'https://www.googleapis.com/calendar/v3/calendars/primary/events'
+
+# The initial sync only covers events starting within this window, a page at a time
+SYNC_WINDOW = timedelta(days=30)
+SYNC_PAGE_SIZE = 250
+
 class GoogleCalendarServer:
     def __init__(self):
         self.creds = None
-        self.service = None
+        # One keep-alive pool for every API call; created on first use so it
+        # binds to the running event loop
+        self._session: Optional[aiohttp.ClientSession] = None
         self.logger = logging.getLogger(__name__)
+        # Last (etag, items) per list query, revalidated with If-None-Match
+        self._etag_cache: Dict[Tuple, Tuple[str, List[Dict[str, Any]]]] = {}
+        # Token for incremental sync; None until the first full sync completes
+        self._sync_token = None
         self._authenticate()
 
     def _authenticate(self):
@@ -45,39 +56,147 @@ class GoogleCalendarServer:
             with open(token_path, 'w') as token:
                 token.write(self.creds.to_json())
 
-        self.service = build('calendar', 'v3', credentials=self.creds)
+    async def _request_events(self, params: Dict[str, Any],
+                              etag: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """GET the primary events collection; None means 304 Not Modified."""
+        if not self.creds.valid and self.creds.refresh_token:
+            # google-auth refreshes over blocking HTTP
+            await asyncio.to_thread(self.creds.refresh, Request())
+        
+        # Created only once the credentials are usable, so a failed refresh
+        # doesn't leave an unclosed pool behind
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=4, keepalive_timeout=300)
+            )
+        
+        headers = {'Authorization': f'Bearer {self.creds.token}'}
+        if etag:
+            headers['If-None-Match'] = etag
+        
+        async with self._session.get(EVENTS_URL, params=params, headers=headers) as response:
+            if response.status == 304:
+                return None
+            response.raise_for_status()
+            return await response.json()
+
+    async def close(self):
+        """Close the HTTP connection pool."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _list_events(self, cache_key: Tuple, **params) -> Tuple[List[Dict[str, Any]], bool]:
+        """List primary-calendar events, returning (items, not_modified)."""
+        cached = self._etag_cache.get(cache_key)
+        events_result = await self._request_events(
+            {'singleEvents': 'true', 'orderBy': 'startTime', **params},
+            etag=cached[0] if cached else None
+        )
+        # 304: the list is unchanged, so skip the download and the parse
+        if events_result is None:
+            return cached[1], True
+        
+        events = events_result.get('items', [])
+        if events_result.get('etag'):
+            self._etag_cache[cache_key] = (events_result['etag'], events)
+        return events, False
+
+    @staticmethod
+    def _has_ended(event: Dict[str, Any], now: datetime) -> bool:
+        """Whether an event finished before `now` (timezone-aware UTC)."""
+        end = event.get('end', {})
+        if 'dateTime' in end:
+            return datetime.fromisoformat(end['dateTime'].replace('Z', '+00:00')) <= now
+        if 'date' in end:
+            # All-day end dates are exclusive
+            return end['date'] <= now.date().isoformat()
+        return False
 
     async def get_upcoming_events(self, max_results: int = 10) -> List[Dict[str, Any]]:
         """Get upcoming events from Google Calendar."""
         try:
             now = datetime.utcnow().isoformat() + 'Z'  # 'Z' indicates UTC time
-            events_result = self.service.events().list(
-                calendarId='primary',
+            events, not_modified = await self._list_events(
+                ('upcoming', max_results),
                 timeMin=now,
-                maxResults=max_results,
-                singleEvents=True,
-                orderBy='startTime'
-            ).execute()
-            events = events_result.get('items', [])
+                maxResults=max_results
+            )
+            if not_modified:
+                # The cached list was fetched for an earlier timeMin
+                now_utc = datetime.now(timezone.utc)
+                events = [event for event in events if not self._has_ended(event, now_utc)]
             
-            formatted_events = []
-            for event in events:
-                formatted_events.append({
-                    'id': event.get('id', ''),
-                    'summary': event.get('summary', 'No title'),
-                    'description': event.get('description', ''),
-                    'start': event.get('start', {}),
-                    'end': event.get('end', {}),
-                    'attendees': event.get('attendees', []),
-                    'hangoutLink': event.get('hangoutLink', ''),
-                    'status': event.get('status', '')
-                })
+            return [self._format_event(event) for event in events]
+        except aiohttp.ClientError as error:
+            self.logger.error(f'An error occurred: {error}')
+            return []
+
+    async def get_event_changes(self) -> List[Dict[str, Any]]:
+        """Get events changed since the last call, using incremental sync tokens."""
+        try:
+            try:
+                events = await self._sync_events()
+            except aiohttp.ClientResponseError as error:
+                # 410 Gone: the sync token expired, so start over with a full sync
+                if error.status != 410:
+                    raise
+                self.logger.info('Calendar sync token expired, running a full sync')
+                self._sync_token = None
+                events = await self._sync_events()
             
-            return formatted_events
-        except HttpError as error:
+            # Deltas cover the whole calendar; keep only events still to come.
+            # Cancelled events are passed through so callers can drop them.
+            now_utc = datetime.now(timezone.utc)
+            return [
+                self._format_event(event) for event in events
+                if event.get('status') == 'cancelled' or not self._has_ended(event, now_utc)
+            ]
+        except aiohttp.ClientError as error:
             self.logger.error(f'An error occurred: {error}')
             return []
 
+    async def _sync_events(self) -> List[Dict[str, Any]]:
+        """Page through a full or incremental sync and store the next sync token."""
+        if self._sync_token:
+            params = {'syncToken': self._sync_token}
+        else:
+            # Initial full sync, bounded so a long-lived calendar isn't paged
+            # through in full; incremental requests may not repeat the window
+            now = datetime.utcnow()
+            params = {
+                'timeMin': now.isoformat() + 'Z',
+                'timeMax': (now + SYNC_WINDOW).isoformat() + 'Z',
+            }
+        
+        params['singleEvents'] = 'true'
+        params['maxResults'] = SYNC_PAGE_SIZE
+        events = []
+        while True:
+            events_result = await self._request_events(params)
+            events.extend(events_result.get('items', []))
+            page_token = events_result.get('nextPageToken')
+            if not page_token:
+                break
+            params['pageToken'] = page_token
+        
+        self._sync_token = events_result.get('nextSyncToken')
+        return events
+
+    @staticmethod
+    def _format_event(event: Dict[str, Any]) -> Dict[str, Any]:
+        """Reduce a Calendar API event to the fields the agent uses."""
+        return {
+            'id': event.get('id', ''),
+            'summary': event.get('summary', 'No title'),
+            'description': event.get('description', ''),
+            'start': event.get('start', {}),
+            'end': event.get('end', {}),
+            'attendees': event.get('attendees', []),
+            'hangoutLink': event.get('hangoutLink', ''),
+            'status': event.get('status', '')
+        }
+
     async def get_events_for_today(self) -> List[Dict[str, Any]]:
         """Get all events for today."""
         try:
@@ -87,24 +206,24 @@ class GoogleCalendarServer:
             time_min = today_start.isoformat() + 'Z'
             time_max = today_end.isoformat() + 'Z'
             
-            events_result = self.service.events().list(
-                calendarId='primary',
+            events, _ = await self._list_events(
+                ('today', time_min),
                 timeMin=time_min,
-                timeMax=time_max,
-                singleEvents=True,
-                orderBy='startTime'
-            ).execute()
-            events = events_result.get('items', [])
+                timeMax=time_max
+            )
             
             return events
-        except HttpError as error:
+        except aiohttp.ClientError as error:
             self.logger.error(f'An error occurred: {error}')
             return []
 
 # Simple test function
 async def test_calendar():
     server = GoogleCalendarServer()
-    events = await server.get_upcoming_events(5)
+    try:
+        events = await server.get_upcoming_events(5)
+    finally:
+        await server.close()
     print("Upcoming events:")
     for event in events:
         start_time = event['start'].get('dateTime', event['start'].get('date'))
@@ -2,52 +2,64 @@
 """
 Simple demo runner for Proactive Context-Awareness AI
 """
+import asyncio
 import sys
 import os
+import traceback
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
 
 # Add the core-agent to Python path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'core-agent', 'src'))
 
-async def main():
-    try:
-        from main_agent import ProactiveAIAgent
-        
-        print("🚀 Starting Proactive Context-Awareness AI Agent")
-        print("=" * 50)
-        
-        ai_agent = ProactiveAIAgent()
-        await ai_agent.initialize()
-        
-        # Show the menu instead of calling non-existent main()
-        while True:
-            print("\nOptions:")
-            print("1. Run continuous monitoring")
-            print("2. Interactive context search") 
-            print("3. Check current context")
-            print("4. Exit")
-            
-            choice = input("\nSelect option (1-4): ").strip()
-            
-            if choice == "1":
-                await ai_agent.run_continuous_agent()
-            elif choice == "2":
-                await ai_agent.interactive_search()
-            elif choice == "3":
-                await ai_agent.check_current_context()
-            elif choice == "4":
-                print("👋 Goodbye!")
-                break
-            else:
-                print("❌ Invalid choice")
-        
-    except ImportError as e:
-        print(f"❌ Import error: {e}")
+# Resolved once at startup; main() reports a failed import instead of retrying it
+try:
+    # One menu loop, owned by the agent module
+    from main_agent import main as agent_main
+    _import_error = None
+except ImportError as e:
+    agent_main = None
+    _import_error = e
+
+async def main(handle_signals: bool = True):
+    if agent_main is None:
+        print(f"❌ Import error: {_import_error}")
         print("Please make sure all files are in the correct locations.")
+        return
+    
+    try:
+        await agent_main(handle_signals)
     except Exception as e:
         print(f"❌ Error: {e}")
-        import traceback
         traceback.print_exc()
 
+# Strong references to demo tasks scheduled on a host's event loop
+_running = set()
+
+def run():
+    """Start the demo, scheduling it on the host's event loop if one is already running"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    
+    if loop is not None:
+        # Embedded (e.g. Jupyter): the host owns the loop and its signal handling.
+        # The loop only holds tasks weakly, so keep the demo alive until it ends
+        task = loop.create_task(main(handle_signals=False))
+        _running.add(task)
+        task.add_done_callback(_running.discard)
+        return task
+    
+    # libuv-backed loop when available; free-threaded builds and Windows
+    # stay on the stdlib loop (the proactor loop is already the default there)
+    if uvloop is not None and getattr(sys, "_is_gil_enabled", lambda: True)():
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
+
 if __name__ == "__main__":
-    import asyncio
-    asyncio.run(main())
\ No newline at end of file
+    run()